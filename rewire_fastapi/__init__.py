@@ -1,32 +1,29 @@
 from contextlib import suppress
-from copy import copy
 from enum import Enum
-from functools import wraps
+from functools import lru_cache, wraps
 from typing import (
     Any,
     Callable,
+    Collection,
     Dict,
     List,
     Literal,
+    Mapping,
     Optional,
-    Sequence,
+    TYPE_CHECKING,
     Union,
-    cast,
 )
 from typing_extensions import Annotated
-from venv import logger
+from loguru import logger
 
-from fastapi.dependencies.models import Dependant
 from rewire import ConfigDependency, LifecycleModule, simple_plugin
 from fastapi import FastAPI
-from fastapi.routing import APIRoute
 from pydantic import BaseModel, Field
-import fastapi.openapi.docs
-import fastapi.applications
-from fastapi.middleware.cors import CORSMiddleware
 from rewire_fastapi.dependable import Dependable
 from rewire_fastapi.patch import Patch
-from fastapi.dependencies.utils import get_dependant
+
+if TYPE_CHECKING:
+    from fastapi.dependencies.models import Dependant
 
 plugin = simple_plugin()
 
@@ -43,7 +40,7 @@ __all__ = [
 ]
 
 
-class AppConfig(BaseModel, extra="allow"):
+class AppConfig(BaseModel, extra="allow", frozen=True):
     debug: bool = False
     title: str = "FastAPI"
     description: str = ""
@@ -55,40 +52,40 @@ class AppConfig(BaseModel, extra="allow"):
     redoc_url: Optional[str] = "/redoc"
 
 
-class UvicornConfig(BaseModel, extra="allow"):
+class UvicornConfig(BaseModel, extra="allow", frozen=True):
     enabled: bool = True
     host: str = "0.0.0.0"
     port: int = 8000
 
 
-class HypercornConfig(BaseModel, extra="allow"):
+class HypercornConfig(BaseModel, extra="allow", frozen=True):
     enabled: bool = False
 
     bind: str = "0.0.0.0:8000"
 
 
-class RouteConfig(BaseModel):
+class RouteConfig(BaseModel, frozen=True):
     tag_prefix: str = ""
 
 
-class PatchConfig(BaseModel):
+class PatchConfig(BaseModel, frozen=True):
     swagger_hierarchical_tags: bool = False
     tag_prefixes: bool = True
-    dependency_overrides: dict[Callable, Callable] = {}
+    dependency_overrides: dict[Callable, Callable] = Field(default_factory=dict)
     """Will be reflected in swagger"""
 
 
-class CORSConfig(BaseModel):
-    allow_origins: Sequence[str] = []
-    allow_methods: Sequence[str] = ["*"]
-    allow_headers: Sequence[str] = ["*"]
+class CORSConfig(BaseModel, frozen=True):
+    allow_origins: tuple[str, ...] = ()
+    allow_methods: tuple[str, ...] = ("*",)
+    allow_headers: tuple[str, ...] = ("*",)
     allow_credentials: bool = True
     allow_origin_regex: Optional[str] = None
-    expose_headers: Sequence[str] = []
+    expose_headers: tuple[str, ...] = ()
     max_age: int = 600
 
 
-class MiddlewareConfig(BaseModel):
+class MiddlewareConfig(BaseModel, frozen=True):
     cors: CORSConfig | None = None
 
 
@@ -114,6 +111,26 @@ class Config(ConfigDependency):
         return f"http://{host}:{self.uvicorn.port}"
 
 
+def _copy_containers(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_copy_containers(x) for x in value]
+    if isinstance(value, dict):
+        return {k: _copy_containers(v) for k, v in value.items()}
+    return value
+
+
+def _shallow_dict(model: BaseModel, exclude: Collection[str] = ()) -> dict[str, Any]:
+    """Field values of already validated `model` without serialization
+
+    Lists and dicts are copied, so consumers (e.g. FastAPI adding root path to
+    `servers`) can't mutate config
+    """
+    values = {**model.__dict__, **(model.__pydantic_extra__ or {})}
+    for key in exclude:
+        values.pop(key, None)
+    return {k: _copy_containers(v) for k, v in values.items()}
+
+
 async def run_uvicorn(app: FastAPI, cfg: Config.Value):
     import uvicorn.config
 
@@ -123,7 +140,7 @@ async def run_uvicorn(app: FastAPI, cfg: Config.Value):
     logger.info(f"Starting fastapi with uvicorn at {cfg.endpoint}")
     config = uvicorn.config.Config(
         app,
-        **cfg.uvicorn.model_dump(exclude={"enabled"}),
+        **_shallow_dict(cfg.uvicorn, exclude={"enabled"}),
     )
     server = uvicorn.Server(config=config)
 
@@ -150,22 +167,20 @@ async def run_hypercorn(app: FastAPI, cfg: Config.Value):
     from hypercorn.config import Config
 
     lib = sniffio.current_async_library()
-    config = Config().from_mapping(cfg.hypercorn.model_dump())
-
     if lib == "asyncio":
         from hypercorn.asyncio import serve
-
-        return await serve(app, config)  # type: ignore
-    if lib == "trio":
+    elif lib == "trio":
         from hypercorn.trio import serve
+    else:
+        raise NotImplementedError(f"Unable to start hypercorn with {lib}")
 
-        return await serve(app, config)  # type: ignore
-    raise NotImplementedError(f"Unable to start hypercorn with {lib}")
+    config = Config.from_mapping(_shallow_dict(cfg.hypercorn, exclude={"enabled"}))
+    return await serve(app, config)  # type: ignore
 
 
 @plugin.setup()
 def create_fastapi(config: Config.Value) -> FastAPI:
-    return FastAPI(**config.app.model_dump())
+    return FastAPI(**_shallow_dict(config.app))
 
 
 @plugin.run()
@@ -179,7 +194,9 @@ async def run_fastapi_app(app: FastAPI, cfg: Config.Value):
 @plugin.setup()
 def add_middleware(app: FastAPI, config: Config.Value):
     if config.middleware.cors is not None:
-        app.add_middleware(CORSMiddleware, **config.middleware.cors.model_dump())
+        from fastapi.middleware.cors import CORSMiddleware
+
+        app.add_middleware(CORSMiddleware, **_shallow_dict(config.middleware.cors))
 
 
 @plugin.setup()
@@ -192,25 +209,36 @@ def stop_on_app_stop(app: FastAPI):
             await lm.stop()
 
 
+@lru_cache(maxsize=8)
+def _patch_swagger_body(body: bytes) -> bytes:
+    return body.replace(
+        b"<!-- `SwaggerUIBundle` is now available on the page -->",
+        b"<!-- `SwaggerUIBundle` is now available on the page -->\n"
+        b'<script src="https://unpkg.com/swagger-ui-plugin-hierarchical-tags"></script>',
+    ).replace(
+        b"SwaggerUIBundle({",
+        b"SwaggerUIBundle({\nplugins: [HierarchicalTagsPlugin],\n",
+    )
+
+
 @plugin.setup()
 def add_hierarchial_tags(config: Config.Value):
     if not config.patch.swagger_hierarchical_tags:
         return
 
+    import fastapi.openapi.docs
+    import fastapi.applications
+
     get_swagger_ui_html = fastapi.openapi.docs.get_swagger_ui_html
+    if getattr(get_swagger_ui_html, "_hierarchical_tags", False):
+        return  # already patched by previous setup in this process
 
     @wraps(get_swagger_ui_html)
     def get_swagger_ui_html_patched(*a, **kw):
         value = get_swagger_ui_html(*a, **kw)
-        body = value.body.replace(
-            b"<!-- `SwaggerUIBundle` is now available on the page -->",
-            b"<!-- `SwaggerUIBundle` is now available on the page -->\n"
-            b'<script src="https://unpkg.com/swagger-ui-plugin-hierarchical-tags"></script>',
-        ).replace(
-            b"SwaggerUIBundle({",
-            b"SwaggerUIBundle({\nplugins: [HierarchicalTagsPlugin],\n",
-        )
-        return type(value)(body)
+        return type(value)(_patch_swagger_body(bytes(value.body)))
+
+    get_swagger_ui_html_patched._hierarchical_tags = True  # type: ignore
 
     fastapi.openapi.docs.get_swagger_ui_html = get_swagger_ui_html_patched
     fastapi.applications.get_swagger_ui_html = get_swagger_ui_html_patched  # type: ignore
@@ -218,53 +246,166 @@ def add_hierarchial_tags(config: Config.Value):
 
 @plugin.setup(stage=100)
 def patch_router_tags(app: FastAPI, config: Config.Value):
-    if not config.patch.tag_prefixes:
+    prefix = config.routes.tag_prefix
+    if not config.patch.tag_prefixes or not prefix:
         return
 
-    for route in app.router.routes:
-        if not isinstance(route, APIRoute):
-            continue
+    from fastapi.routing import APIRoute
+
+    prefix_no_colon = prefix.removesuffix(":")
 
-        if config.routes.tag_prefix:
-            route.tags = [
-                cast(str | Enum, f"{config.routes.tag_prefix}{x}".removesuffix(":"))
-                for x in route.tags
-            ]
+    def _pfx(x: str | Enum) -> str | Enum:
+        if type(x) is not str:
+            x = f"{x}"  # Enum and str subclasses use their format()
+        if x.endswith(":"):
+            return prefix + x[:-1]
+        return prefix + x if x else prefix_no_colon
 
-    if app.openapi_tags and config.routes.tag_prefix:
+    for route in app.router.routes:
+        if isinstance(route, APIRoute):
+            route.tags = list(map(_pfx, route.tags))
+
+    if app.openapi_tags:
         for tag in app.openapi_tags:
-            tag["name"] = f"{config.routes.tag_prefix}{tag['name']}".removesuffix(":")
-
-
-def patch_dependant(dependant: Dependant, config: PatchConfig):
-    if dependant.call in config.dependency_overrides:
-        assert dependant.path is not None
-        previous = dependant
-        dependant = get_dependant(
-            call=config.dependency_overrides[dependant.call],
-            path=dependant.path,
-            name=previous.name,
-            use_cache=previous.use_cache,
-            security_scopes=previous.security_scopes,
-        )
-    new_dependencies = [patch_dependant(x, config) for x in dependant.dependencies]
-    should_clone = any(
-        old is not new for old, new in zip(dependant.dependencies, new_dependencies)
+            tag["name"] = _pfx(tag["name"])
+
+
+def _get_dependant(
+    call: Callable,
+    path: str,
+    name: str | None,
+    use_cache: bool,
+    security_scopes: tuple[str, ...],
+) -> "Dependant":
+    from fastapi.dependencies.utils import get_dependant
+
+    return get_dependant(
+        call=call,
+        path=path,
+        name=name,
+        use_cache=use_cache,
+        security_scopes=list(security_scopes),
     )
-    if should_clone:
-        dependant = copy(dependant)
-        dependant.dependencies = new_dependencies
 
-    return dependant
+
+def _clone_dependant(dependant: "Dependant") -> "Dependant":
+    new = object.__new__(type(dependant))
+    new.__dict__ = dependant.__dict__.copy()
+    return new
+
+
+def patch_dependant(
+    root: "Dependant",
+    overrides: Mapping[Callable, Callable],
+    memo: "dict[int, tuple[Dependant, Dependant]] | None" = None,
+    dependants: "dict[tuple, Dependant] | None" = None,
+    _id=id,
+    _get=_get_dependant,
+    _clone=_clone_dependant,
+) -> "Dependant":
+    """Replace overridden dependencies in dependant tree
+
+    Tree is walked iteratively in post-order. Each unique node is patched once,
+    `memo` maps `id(node)` to `(node, patched)` and can be shared between
+    routes so common sub-dependants are reused. `dependants` caches override
+    dependants by `get_dependant` arguments, so override signature is
+    introspected once per setup
+
+    Raises `RecursionError` if override depends (directly or not) on dependency
+    it replaces
+    """
+    if memo is None:
+        memo = {}
+    if dependants is None:
+        dependants = {}
+    overrides_get = overrides.get
+    active: set[int] = set()  # ids of override calls on current path
+
+    stack: list[tuple[Dependant, Dependant | None]] = [(root, None)]
+    push = stack.append
+    while stack:
+        node, current = stack.pop()
+        if _id(node) in memo:
+            continue
+
+        if current is None:
+            current = node
+            new_call = overrides_get(node.call)
+            if new_call is not None:
+                if _id(new_call) in active:
+                    raise RecursionError(
+                        f"Dependency override {new_call!r} depends on {node.call!r}"
+                        " which it replaces"
+                    )
+                active.add(_id(new_call))
+                assert node.path is not None
+                args = (
+                    new_call,
+                    node.path,
+                    node.name,
+                    node.use_cache,
+                    tuple(node.security_scopes or ()),
+                )
+                key = (_id(new_call), *args[1:])
+                current = dependants.get(key)
+                if current is None:
+                    current = dependants[key] = _get(*args)
+            push((node, current))
+            for x in current.dependencies:
+                if _id(x) not in memo:
+                    push((x, None))
+            continue
+
+        if current is not node:
+            active.discard(_id(current.call))
+
+        changed = False
+        new_dependencies: list[Dependant] = []
+        for old in current.dependencies:
+            new = memo[_id(old)][1]
+            if new is not old:
+                changed = True
+            new_dependencies.append(new)
+        if changed:
+            current = _clone(current)
+            current.dependencies = new_dependencies
+        memo[_id(node)] = (node, current)
+
+    return memo[_id(root)][1]
+
+
+def _tree_touches(
+    dependant: "Dependant", keys: frozenset[Callable], seen: set[int]
+) -> bool:
+    """Whether any call in dependant tree is in `keys`"""
+    stack = [dependant]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if node.call in keys:
+            return True
+        stack.extend(node.dependencies)
+    return False
 
 
 @plugin.setup(stage=100)
 def patch_router_dependency_overrides(app: FastAPI, config: Config.Value):
-    if not config.patch.dependency_overrides:
+    overrides = config.patch.dependency_overrides
+    if not overrides:
         return
-    app.dependency_overrides.update(config.patch.dependency_overrides)
+    app.dependency_overrides.update(overrides)
+
+    from fastapi.routing import APIRoute
 
+    override_keys = frozenset(overrides)
+    memo: dict[int, tuple[Dependant, Dependant]] = {}
+    dependants: dict[tuple, Dependant] = {}
     for route in app.router.routes:
         if not isinstance(route, APIRoute):
             continue
-        route.dependant = patch_dependant(route.dependant, config.patch)
+        if _tree_touches(route.dependant, override_keys, set()):
+            route.dependant = patch_dependant(
+                route.dependant, overrides, memo, dependants
+            )
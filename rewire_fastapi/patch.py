@@ -1,4 +1,6 @@
-from typing import get_args
+from functools import cache, lru_cache
+from keyword import iskeyword
+from typing import Any, Callable, Mapping, get_args
 from pydantic import BaseModel, create_model
 from pydantic_core import core_schema
 from pydantic.json_schema import SkipJsonSchema
@@ -21,21 +23,25 @@ class Patch[T: BaseModel]:
         self.data = data
 
     def apply(self, to: object):
-        for field in self.data.__pydantic_fields_set__:
-            setattr(to, field, getattr(self.data, field))
+        src = {**self.data.__dict__, **(self.data.__pydantic_extra__ or {})}
+        set_names = self.data.__pydantic_fields_set__
+
+        if isinstance(to, BaseModel) and _can_update_dict(to, set_names):
+            vars(to).update({k: src[k] for k in set_names})
+            to.__pydantic_fields_set__.update(set_names)
+            return
+
+        if set_names <= type(self.data).model_fields.keys():
+            _make_applier(frozenset(set_names))(src, to)
+            return
+
+        # extra keys are client controlled, don't compile setters for them
+        for k in set_names:
+            setattr(to, k, src[k])
 
     @classmethod
     def _update_model[B: BaseModel](cls, model: type[B]) -> type[B]:
-        return create_model(
-            f"{model.__name__}Patch",
-            __doc__=model.__doc__,
-            __base__=(model,),
-            __module__=model.__module__,
-            **{
-                k: (v.annotation | SkipJsonSchema[None], None)
-                for k, v in model.model_fields.items()
-            },  # type: ignore
-        )
+        return _build_patch_model(model)
 
     @classmethod
     def __get_pydantic_core_schema__(cls, source, handler):
@@ -55,3 +61,46 @@ class Patch[T: BaseModel]:
 
     def __repr__(self):
         return f"{type(self).__name__}({self.data!r})"
+
+
+def _can_update_dict(model: BaseModel, names: set[str]) -> bool:
+    """Whether `names` can be written to `model.__dict__` bypassing `__setattr__`"""
+    config = model.model_config
+    return (
+        type(model).__setattr__ is BaseModel.__setattr__
+        and not config.get("validate_assignment")
+        and not config.get("frozen")
+        and names <= type(model).model_fields.keys()
+    )
+
+
+@lru_cache(maxsize=256)
+def _make_applier(fields: frozenset[str]) -> Callable[[Mapping[str, Any], Any], None]:
+    """Setter assigning `fields` from values dict to object, compiled once per set"""
+    if not all(x.isidentifier() and not iskeyword(x) for x in fields):
+
+        def _apply(src: Mapping[str, Any], to: Any) -> None:
+            for k in fields:
+                setattr(to, k, src[k])
+
+        return _apply
+
+    lines = [f"    to.{x} = src[{x!r}]" for x in sorted(fields)] or ["    pass"]
+    namespace: dict[str, Any] = {}
+    exec("def _apply(src, to):\n" + "\n".join(lines), namespace)
+    return namespace["_apply"]
+
+
+@cache
+def _build_patch_model[B: BaseModel](model: type[B]) -> type[B]:
+    """Model with all fields of `model` optional, built once per model"""
+    return create_model(
+        f"{model.__name__}Patch",
+        __doc__=model.__doc__,
+        __base__=(model,),
+        __module__=model.__module__,
+        **{
+            k: (v.annotation | SkipJsonSchema[None], None)
+            for k, v in model.model_fields.items()
+        },  # type: ignore
+    )